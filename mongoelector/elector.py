@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 import threading
-from time import sleep
 import logging
 from datetime import datetime
-from pymongo.errors import OperationFailure
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, WriteConcern
+from pymongo.errors import OperationFailure, PyMongoError
 
 
-from mongoelector.locker import MongoLocker, LockExists, AcquireTimeout
+from mongoelector.locker import MongoLocker
+
+log = logging.getLogger(__name__)
 
 
 class MongoElector(object):
@@ -17,7 +23,7 @@ class MongoElector(object):
 
     def __init__(self, key, db,
                  ttl=15, onmaster=None, onmasterloss=None,
-                 onloop=None, app_version=None, report_status=True):
+                 onloop=None, app_version=None, report_status=True, watch=True):
         """
         Create a MongoElector instance
 
@@ -37,23 +43,32 @@ class MongoElector(object):
         :type onloop: Function or Method
         :param app_version: Parent app version, if provided, will be included in node_status for monitoring
         :type app_version: str
+        :param watch: If True, non-master instances wait on a change stream and poll as soon as
+         the master lock is released instead of waiting out the full poll interval.
+         Falls back to plain polling when the server doesn't support change streams.
+        :type watch: bool
         """
         self._poll_lock = threading.Lock()
         self._ts_poll = None
         self._shutdown = False
+        self._wake = threading.Event()  # set by stop() to cut the current wait short
         self._wasmaster = False
         self._app_version = app_version
         self._report_status = report_status
+        self.watch = watch
         self.elector_thread = None
         self.key = key
         self.db = db
-        self._status_collection = getattr(self.db, 'elector.status')
+        # status documents are disposable (TTL expired, rewritten every poll), skip waiting on the journal
+        self._status_collection = self.db.get_collection('elector.status',
+                                                         write_concern=WriteConcern(w=1, j=False))
         try:
             self._status_collection.create_index('timestamp', expireAfterSeconds=int(ttl))
         except OperationFailure:  # Handle TTL Changes
-            self._status_collection.drop_indexes()
+            self._status_collection.drop_index('timestamp_1')
             self._status_collection.create_index('timestamp', expireAfterSeconds=int(ttl))
-        self._status_collection.create_index('key')
+        # (key, timestamp) serves cluster_detail's and master_detail's filter and sort straight from the index
+        self._status_collection.create_index([('key', ASCENDING), ('timestamp', DESCENDING)])
         self.ttl = ttl
         self.callback_onmaster = onmaster
         self.callback_onmasterloss = onmasterloss
@@ -61,6 +76,12 @@ class MongoElector(object):
         self.mlock = MongoLocker(self.key, self.db,
                                  dbcollection='elector.locks', ttl=self.ttl,
                                  timeparanoid=True)
+        # per-node offset of up to ttl/4, derived from the uuid, so followers don't all
+        # wake and race for the lock at the same moment
+        self._jitter = int(self.mlock.uuid[:2], 16) / 256.0 * self.ttl * 0.25
+        self._status_static = {'_id': self.mlock.uuid}
+        if self._app_version:
+            self._status_static['app_version'] = self._app_version
 
     def start(self, blocking=False):
         """
@@ -77,17 +98,45 @@ class MongoElector(object):
             self.elector_thread.join()
 
     def stop(self):
-        """Cleanly stop the elector. Surrender master if owned"""
-        with self._poll_lock:
-            self._shutdown = True
-            if self.elector_thread:
-                self.elector_thread.join()
+        """
+        Cleanly stop the elector. Surrender master if owned.
+        Safe to call from a callback; the elector thread then exits after the current poll.
+        """
+        self._shutdown = True
+        self._wake.set()
+        thread = self.elector_thread
+        if thread and thread is not threading.current_thread():
+            if isinstance(thread, MultiElectorThread):
+                with thread.cycle_lock:  # shared thread keeps running, wait out an in-flight poll
+                    pass
+            else:
+                thread.join()
         self.release()
 
+    @classmethod
+    def start_many(cls, electors):
+        """
+        Starts polling several electors that share a database from a single
+        background thread, using poll_many(). Stop each elector with stop();
+        the thread exits once all of them are stopped.
+
+        :param electors: MongoElector instances sharing one database
+        :type electors: list
+        :return: the shared polling thread
+        :rtype: MultiElectorThread
+        """
+        cls._check_shared_db(electors)  # fail here rather than on every poll of the thread
+        thread = MultiElectorThread(electors)
+        for elector in electors:
+            elector.elector_thread = thread
+            elector._wake = thread.wake
+        thread.start()
+        return thread
+
     @property
     def running(self):
         """Returns true if the elector logic is running"""
-        return self.elector_thread.isAlive()
+        return bool(self.elector_thread and self.elector_thread.is_alive() and not self._shutdown)
 
     @property
     def ismaster(self):
@@ -107,64 +156,114 @@ class MongoElector(object):
 
         In general, this should only be called by the elector thread
         """
-        with self._poll_lock:
-            self._ts_poll = datetime.utcnow()
-            if self.mlock.owned():
-                self._wasmaster = True
-                self.mlock.touch()
-            else:
-                if self._wasmaster:
-                    self._wasmaster = False
-                    if self.callback_onmasterloss:
-                        self.callback_onmasterloss()
+        self._ts_poll = datetime.utcnow()
+        touched = bool(self.mlock.touch())  # only succeeds if we still own the lock
+        acquired = False
+        if not touched and not self._shutdown:
+            acquired = self.mlock.acquire_if_free()
+        self._set_master(touched, acquired)
+        if self._report_status:
+            self.report_status()
+        if self.callback_onloop:
+            self.callback_onloop()
 
-            if not self.master_exists and not self._shutdown:
-                try:
-                    self.mlock.acquire(blocking=False)
-                except (LockExists, AcquireTimeout):
-                    pass
-                else:
-                    if self.mlock.owned():
-                        self._wasmaster = True
-                        if self.callback_onmaster:
-                            self.callback_onmaster()
-            if self._report_status:
-                self.report_status()
-            if self.callback_onloop:
-                self.callback_onloop()
+    @classmethod
+    def poll_many(cls, electors):
+        """
+        Polls several electors that share a database in a constant number of round-trips:
+        one bulk renewal and one read covering every lock, then one bulk status write.
+        Only keys whose lock is free cost an extra acquire attempt each.
+        Callbacks run just as they do from poll().
+
+        :param electors: MongoElector instances sharing one database
+        :type electors: list
+        """
+        if not electors:
+            return
+        cls._check_shared_db(electors)
+        ts_poll = datetime.utcnow()
+        current = MongoLocker.touch_many([elector.mlock for elector in electors])
+        statuses = []
+        for elector in electors:
+            elector._ts_poll = ts_poll
+            lock = current.get(elector.key)
+            touched = bool(lock and lock['uuid'] == elector.mlock._uuid)
+            acquired = False
+            if lock is None and not elector._shutdown:
+                acquired = elector.mlock.acquire_if_free()
+                if acquired:
+                    lock = elector.mlock.get_current()
+            elector._set_master(touched, acquired)
+            if elector._report_status:
+                status = elector._node_status_from(elector.mlock._status_from(lock))
+                statuses.append(ReplaceOne({'_id': status['_id']}, status, upsert=True))
+        if statuses:
+            electors[0]._status_collection.bulk_write(statuses, ordered=False)
+        for elector in electors:
+            if elector.callback_onloop:
+                elector.callback_onloop()
+
+    @staticmethod
+    def _check_shared_db(electors):
+        if any(elector.db != electors[0].db for elector in electors):
+            raise ValueError("electors polled together must share a database")
+
+    def _set_master(self, touched, acquired):
+        """Records the outcome of a poll and fires onmaster/onmasterloss on a change"""
+        with self._poll_lock:  # guard state only, never hold across a mongo call
+            lost = self._wasmaster and not touched
+            self._wasmaster = touched or acquired
+        if lost and self.callback_onmasterloss:
+            self.callback_onmasterloss()
+        if acquired and self.callback_onmaster:
+            self.callback_onmaster()
 
     def report_status(self):
+        """Writes this node's status document in a single upsert"""
         status = self.node_status
-        self._status_collection.update({'_id': status['_id']}, status, upsert=True)
+        self._status_collection.replace_one({'_id': status['_id']}, status, upsert=True)
 
     @property
     def cluster_detail(self):
-        data = [x for x in self._status_collection.find({'key': self.key}, {'_id': 0}).sort('timestamp', -1)]
+        """
+        Status of every member of this elector's cluster, newest first, plus the current master.
+        Each node upserts a single status document keyed on its uuid, so this is one
+        document per live node fetched in a single query.
+        """
+        data = list(self._status_collection.find({'key': self.key}, {'_id': 0}).sort('timestamp', -1))
         return {'member_detail': data,
                 'master': parse_master(data),
                 'timestamp': datetime.utcnow()}
 
+    @property
+    def master_detail(self):
+        """Host, process id and uuid of the current master as last reported, or None"""
+        master = self._status_collection.find_one({'key': self.key, 'ismaster': True},
+                                                  sort=[('timestamp', DESCENDING)])
+        return parse_master([master] if master else [])
+
     @property
     def node_status(self):
         """Status info for current object"""
-        status = self.mlock.status
-        status['_id'] = status['uuid']
-        status['ismaster'] = self.ismaster
+        return self._node_status_from(self.mlock.status)
+
+    def _node_status_from(self, status):
+        """Adds elector details to a MongoLocker status dict"""
+        status.update(self._status_static)
+        status['ismaster'] = status['lock_owned']  # same lock read, no second owned() query
         status['elector_running'] = self.running
         status['last_poll'] = self._ts_poll
-        if self._app_version:
-            status['app_version'] = self._app_version
         return status
 
     def release(self):
         """
         Releases master lock if owned and calls onmasterloss if provided.
         """
+        self.mlock.release()
         with self._poll_lock:
-            self.mlock.release()
-            if self._wasmaster and self.callback_onmaster:
-                self.callback_onmasterloss()
-
+            wasmaster, self._wasmaster = self._wasmaster, False
+        if wasmaster and self.callback_onmasterloss:
+            self.callback_onmasterloss()
 
     @property
     def pollwait(self):
@@ -172,7 +271,7 @@ class MongoElector(object):
         if self._wasmaster:
             return self.ttl / 2.0
         else:
-            return self.ttl
+            return self.ttl - self._jitter
 
 
 class ElectorThread(threading.Thread):
@@ -181,7 +280,9 @@ class ElectorThread(threading.Thread):
     def __init__(self, elector):
         """Custom Thread object for the Elector"""
         super(ElectorThread, self).__init__()
+        self.daemon = True  # never hold up interpreter exit, the lock simply expires
         self.elector = elector
+        self._stream = None
 
     def run(self):
         """starts the elector polling logic, should not be called directly"""
@@ -189,18 +290,84 @@ class ElectorThread(threading.Thread):
         while self.elector._shutdown is False:
             try:
                 self.elector.poll()
-            except Exception as e:
-                logging.warning('Elector Poll Error: {}'.format(e))
+            except Exception:
+                log.warning('Elector poll error', exc_info=True)
             finally:
-                sleep(self.elector.pollwait)
+                self.wait(self.elector.pollwait)
+        self._close_stream()
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds before the next poll. While not master, waits on
+        a change stream so the next poll happens as soon as the master lock is released.
+        """
+        # noinspection PyProtectedMember
+        if self.elector._wasmaster or not self.elector.watch:
+            self._close_stream()
+            self.elector._wake.wait(timeout)
+            return
+        if self._stream is None:
+            # each try_next() blocks at most a second so a stop() is noticed promptly
+            max_await = min(int(self.elector.ttl * 500), 1000)
+            try:
+                self._stream = self.elector.mlock.watch_release(max_await_time_ms=max_await)
+            except PyMongoError as e:  # e.g. server unreachable, plain wait and retry next time
+                log.warning('Elector change stream error: %s', e)
+                self._stream = None
+                self.elector._wake.wait(timeout)
+                return
+            if self._stream is None:  # change streams unsupported, stop trying
+                self.elector.watch = False
+                self.elector._wake.wait(timeout)
+                return
+        deadline = monotonic() + timeout
+        while monotonic() < deadline and self.elector._shutdown is False:
+            try:
+                if self._stream.try_next() is not None:
+                    self.elector._wake.wait(self.elector._jitter)  # stagger the race for the lock
+                    return
+            except PyMongoError as e:
+                log.warning('Elector change stream error: %s', e)
+                self._close_stream()
+                self.elector._wake.wait(max(0, deadline - monotonic()))
+                return
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class MultiElectorThread(threading.Thread):
+    """Polls several electors from one thread, see MongoElector.start_many"""
+
+    def __init__(self, electors):
+        """Custom Thread object shared by several Electors"""
+        super(MultiElectorThread, self).__init__()
+        self.daemon = True
+        self.electors = list(electors)
+        self.cycle_lock = threading.Lock()  # held for the duration of each poll_many
+        self.wake = threading.Event()
+
+    def run(self):
+        """polls until every elector is stopped, should not be called directly"""
+        while True:
+            with self.cycle_lock:
+                # noinspection PyProtectedMember
+                active = [elector for elector in self.electors if elector._shutdown is False]
+                if not active:
+                    break
+                try:
+                    MongoElector.poll_many(active)
+                except Exception:
+                    log.warning('Elector poll error', exc_info=True)
+            self.wake.wait(min(elector.pollwait for elector in active))
+            self.wake.clear()  # set by stop() of a single elector, the others keep going
 
 
 def parse_master(data):
-    allmasters = [x for x in data if x['ismaster']]  # grab most recent master (prevents race)
-    if allmasters:
-        master = allmasters[0]
-    else:
-        master = None
+    # data is sorted newest first, grab most recent master (prevents race)
+    master = next((x for x in data if x['ismaster']), None)
     if master:
         return {'host': master['host'],
                 'process_id': master['pid'],
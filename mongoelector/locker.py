@@ -1,11 +1,49 @@
+import threading
 import uuid
 from os import getpid
+from random import random
 from socket import getfqdn
 from time import sleep
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
 from datetime import datetime, timedelta
-from pymongo import ReturnDocument
+from bson.binary import STANDARD
+from pymongo.read_concern import ReadConcern
+from pymongo import ASCENDING, ReadPreference, ReturnDocument, UpdateOne, WriteConcern
 from pymongo.database import Database
-from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+
+
+_fqdn = None  # shared by all instances, getfqdn() may block on a DNS lookup
+
+
+def _lock_collection(db, name):
+    """
+    Lock collection, owner uuids are stored as standard BSON UUIDs (16 byte binary).
+    Lock state is always read from and written to the primary with majority concern,
+    so a failover can't roll back an acquire or serve a stale owner.
+    """
+    return db.get_collection(name,
+                             codec_options=db.codec_options.with_options(uuid_representation=STANDARD),
+                             read_preference=ReadPreference.PRIMARY,
+                             write_concern=WriteConcern(w='majority', j=True),
+                             read_concern=ReadConcern('majority'))
+
+
+def _utcnow():
+    """Current utc time at BSON date precision, so timestamps kept locally equal the stored ones"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _hostname():
+    """Fully qualified hostname of this process, looked up once on first use"""
+    global _fqdn
+    if _fqdn is None:
+        _fqdn = getfqdn()
+    return _fqdn
 
 
 class LockExists(Exception):
@@ -28,8 +66,17 @@ class MongoLocker(object):
 
     """
 
+    # guards the per-client record of lock collections whose indexes are set up
+    _ttl_setup_lock = threading.Lock()
+    # seconds before a collection's indexes are set up again, in case it was dropped since
+    _ttl_setup_refresh = 600
+    # longest time a blocked acquire waits server-side for a release event per poll, in seconds,
+    # shortened to the acquire's step so even the first backoff delay is watched
+    _watch_await = 1.0
+
     def __init__(self, key, db,
-                 dbcollection='mongolocker', ttl=600, timeparanoid=True):
+                 dbcollection='mongolocker', ttl=600, timeparanoid=True,
+                 backoff_base=1.5, backoff_cap=5, backoff_jitter=0.1, renew_interval=None):
         """
         :param key: Name of distributed lock
         :type key: str
@@ -43,95 +90,185 @@ class MongoLocker(object):
         :type ttl: int
         :param timeparanoid: Sanity check to ensure local server time matches mongodb server time (utc)
         :type timeparanoid: bool
+        :param backoff_base: Blocking acquire multiplies its delay between attempts by this after each attempt
+        :type backoff_base: float
+        :param backoff_cap: Longest delay in seconds between blocking acquire attempts
+        :type backoff_cap: float or int
+        :param backoff_jitter: Up to this many random seconds are added to each delay to spread out waiters
+        :type backoff_jitter: float
+        :param renew_interval: If set, a background thread touches an acquired lock every renew_interval
+         seconds until it is released or lost. Keep it well under ttl, e.g. ttl / 3.
+        :type renew_interval: float or int
         """
-        self.uuid = str(uuid.uuid4())
-        self.host = getfqdn()
+        self._uuid = uuid.uuid4()  # stored in the lock document
+        self.uuid = str(self._uuid)
+        self._host = None  # resolved on first use
         self.pid = getpid()
         self.ts_expire = None
+        self._local_expire = None
+        self._ts_created = None
         self.timeparanoid = timeparanoid
         self.dbcollection = dbcollection
         self._sanetime = None
+        self._verify_lock = threading.Lock()
         self._maxoffset = 0.5
         self._ttl_indexed = None
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._backoff_jitter = backoff_jitter
+        self.renew_interval = renew_interval
+        self._renewer = None
+        self._renew_stop = None
+        self._releaser = None  # background thread of a release(wait=False)
+        self._watch_supported = True  # cleared once the server turns down a change stream
         if not isinstance(db, Database):
             raise TypeError("Must pass in database connection, not bare mongoclient")
         self.database = db
-        if key and db:
+        if key:  # db was checked above, pymongo 4 Database objects refuse truth testing
             self.key = key
-            self.collection = getattr(self.database, dbcollection)
+            self.collection = _lock_collection(self.database, dbcollection)
+            # renewals are repeated well before expiry, don't wait on replication or the journal for them,
+            # and read them back at the same level they were written
+            self._touch_col = self.collection.with_options(write_concern=WriteConcern(w=1, j=False),
+                                                           read_concern=ReadConcern())
         else:
             raise ValueError("must provide key name and pyongo database connection")
         if ttl:
             if isinstance(ttl, int):
                 self._ttl = ttl
+                self._ttl_delta = timedelta(seconds=ttl)
                 self._setup_ttl()
             else:
                 raise ValueError("ttl must be int() seconds")
+        self._status_base = None
+        self._payload_base = None
+        self._filter_base = None
+        self._owned_filter_base = None
+
+    @property
+    def host(self):
+        """Fully qualified hostname of this instance"""
+        if self._host is None:
+            self._host = _hostname()
+        return self._host
 
     @property
     def status(self):
+        return self._status_from(self.get_current())
+
+    def get_status(self, cached=False):
+        """
+        Same as the status property. With cached=True the status is built from this
+        instance's own record of acquires and renewals without a database round-trip;
+        that view won't notice a forced takeover until the next renewal.
+
+        :param cached: skip the database read
+        :type cached: bool
+        :rtype: dict
+        """
+        if not cached:
+            return self.status
+        if self._local_expire is not None and self._local_expire > monotonic():
+            return self._status_from({'uuid': self._uuid,
+                                      'ts_created': self._ts_created,
+                                      'ts_expire': self.ts_expire})
+        return self._status_from(None)
+
+    def _status_from(self, current):
+        """Builds the status dict from a lock document (or None) already read from the db"""
         lock_created = None
         lock_expires = None
         timestamp = datetime.utcnow()
-        current = self.get_current()
         mine = False
         if current:
-            mine = bool(current.get('uuid', False) == self.uuid)
+            mine = bool(current.get('uuid', False) == self._uuid)
             if mine:  # Only include these details if lock is owned (prevent races)
                 lock_created = current['ts_created']
                 lock_expires = current['ts_expire']
-        return {'uuid': self.uuid,
-                'key': self.key,
-                'ttl': self._ttl,
-                'timestamp': timestamp,
-                'host': self.host,
-                'pid': self.pid,
-                'lock_owned': mine,
-                'lock_created': lock_created,
-                'lock_expires': lock_expires}
+        if self._status_base is None:
+            self._status_base = {'uuid': self.uuid,
+                                 'key': self.key,
+                                 'ttl': self._ttl,
+                                 'host': self.host,
+                                 'pid': self.pid}
+        status = dict(self._status_base)
+        status.update(timestamp=timestamp,
+                      lock_owned=mine,
+                      lock_created=lock_created,
+                      lock_expires=lock_expires)
+        return status
 
     def _setup_ttl(self):
-        try:
-            self.collection.create_index('ts_expire', expireAfterSeconds=self._ttl)
-        except OperationFailure:
-            self.collection.drop_indexes()
-            self.collection.create_index('ts_expire', expireAfterSeconds=self._ttl)
+        # ts_expire already includes the ttl, let the server remove locks as soon as they expire
+        client = self.database.client
+        setup_key = (self.database.name, self.dbcollection)
+        with self._ttl_setup_lock:  # lockers built concurrently on other threads wait for the first one
+            # recorded on the client itself, its id() could be reused by a later client to another cluster
+            setup_done = vars(client).setdefault('_mongolocker_indexed', {})
+            checked = setup_done.get(setup_key)
+            if checked is None or monotonic() - checked > self._ttl_setup_refresh:
+                try:
+                    self.collection.create_index('ts_expire', expireAfterSeconds=0)
+                except OperationFailure:  # ts_expire_1 exists with other options, replace only that index
+                    self.collection.drop_index('ts_expire_1')
+                    self.collection.create_index('ts_expire', expireAfterSeconds=0)
+                # lets locked() and owned(), which only return _id, be answered from the index alone
+                self.collection.create_index([('_id', ASCENDING), ('ts_expire', ASCENDING), ('uuid', ASCENDING)])
+                setup_done[setup_key] = monotonic()
         self._ttl_indexed = True
 
     @staticmethod
-    def _acquireretry(blocking, start, timeout, count):
-        """Determine if a retry is appropriate"""
+    def _deadline(blocking, timeout):
+        """monotonic() time a blocking acquire gives up at, None to retry indefinitely"""
         if blocking is False and timeout:
             raise ValueError("Blocking can't be false with a timeout set")
+        if timeout is None:
+            return None
+        return monotonic() + timeout
+
+    @staticmethod
+    def _acquireretry(blocking, deadline, count):
+        """Determine if a retry is appropriate"""
+        if count == 0:
+            return True
         if blocking is False:
-            if count > 0:
-                return False
-            else:
-                return True
-        else:  # blocking true
-            if count == 0:
-                return True
-            if (datetime.utcnow() - start) > timedelta(seconds=timeout):
-                return False
-            else:
-                return True
+            return False
+        return deadline is None or monotonic() < deadline
+
+    def _backoff(self, step, count, deadline, base=None, cap=None, jitter=None):
+        """
+        Delay before the next acquire attempt: grows exponentially from step up to
+        backoff_cap, plus random jitter, but never past the acquire timeout.
+        base, cap and jitter override the instance's backoff settings when given.
+        """
+        base = self._backoff_base if base is None else base
+        cap = self._backoff_cap if cap is None else cap
+        jitter = self._backoff_jitter if jitter is None else jitter
+        delay = min(cap, step * base ** (count - 1))
+        delay += random() * jitter
+        if deadline is not None:
+            delay = min(delay, max(deadline - monotonic(), 0))
+        return delay
 
     def _verifytime(self):
-        """verify database server's time matches local machine time"""
-        if self._sanetime and self._sanetime > datetime.utcnow() - timedelta(minutes=10):
+        """verify database server's time matches local machine time, rechecked every 10 minutes"""
+        if self._sanetime is not None and monotonic() - self._sanetime < 600:
             return True
-        else:
-            mongotime = self.database.command('serverStatus')['localTime']
+        with self._verify_lock:  # threads sharing this instance make one server round-trip between them
+            if self._sanetime is not None and monotonic() - self._sanetime < 600:
+                return True
+            mongotime = self.database.command('ismaster')['localTime']  # cheap, and needs no clusterMonitor role
             pytime = datetime.utcnow()
             delta = pytime - mongotime
             offset = abs(delta.total_seconds())
             if offset > self._maxoffset:
                 raise Exception("Time offset compared to mongodb is too high {}".format(round(offset, 2)))
             else:
-                self._sanetime = datetime.utcnow()
+                self._sanetime = monotonic()
             return True
 
-    def acquire(self, blocking=True, timeout=None, step=0.25, force=False):
+    def acquire(self, blocking=True, timeout=None, step=0.25, force=False, session=None,
+                backoff_base=None, backoff_cap=None, backoff_jitter=None):
         """
         Attempts to acquire the lock, will block and retry
         indefinitely by default. Can be configured not to block,
@@ -142,46 +279,335 @@ class MongoLocker(object):
         :type blocking: bool
         :param timeout: blocking acquire will fail after timeout in seconds if the lock hasn't been acquired yet.
         :type timeout: int
-        :param step: delay between acquire attempts
+        :param step: delay before the second attempt, later delays back off exponentially
         :type step: float or int
         :param force: CAUTION: will forcibly take ownership of the lock
         :type force: bool
+        :param session: optional pymongo ClientSession to run the operation in
+        :type session: pymongo.client_session.ClientSession
+        :param backoff_base: overrides the instance's backoff_base for this call
+        :type backoff_base: float
+        :param backoff_cap: overrides the instance's backoff_cap for this call
+        :type backoff_cap: float or int
+        :param backoff_jitter: overrides the instance's backoff_jitter for this call
+        :type backoff_jitter: float
+        :return: True once the lock is acquired
+        :rtype: bool
 
+        A connection failure counts as a failed attempt: a blocking acquire keeps
+        retrying until timeout, a non-blocking one raises AcquireTimeout. How long a
+        single attempt can stall is set by the client's socketTimeoutMS and
+        serverSelectionTimeoutMS.
 
+        On a replica set a blocked acquire also watches the lock with a change stream
+        and retries within a step of it being released, instead of waiting out the backoff delay.
         """
         if self.timeparanoid is True:
             self._verifytime()
+        self._finish_release()
         count = 0
-        start = datetime.utcnow()
-        while self._acquireretry(blocking, start, timeout, count):
-            count += 1
-            try:
-                created = datetime.utcnow()
-                self.ts_expire = created + timedelta(seconds=int(self._ttl))
-                payload = {'_id': self.key,
-                           'locked': True,
-                           'host': self.host,
-                           'uuid': self.uuid,
-                           'pid': self.pid,
-                           'ts_created': created,
-                           'ts_expire': self.ts_expire}
-                if force:
-                    res = self.collection.find_one_and_replace({'_id': self.key}, payload, new=True)
+        holder_expire = None
+        deadline = self._deadline(blocking, timeout)
+        jitter = self._backoff_jitter if backoff_jitter is None else backoff_jitter
+        watch_await = min(step, self._watch_await)
+        stream = None
+        try:
+            while self._acquireretry(blocking, deadline, count):
+                count += 1
+                now = _utcnow()
+                try:
+                    if force:
+                        started = monotonic()
+                        created = now
+                        self.ts_expire = created + self._ttl_delta
+                        self.collection.replace_one({'_id': self.key}, self._payload(created),
+                                                    upsert=True, session=session)
+                        self._local_expire = started + self._ttl
+                        self._ts_created = created
+                        self._start_renewer()
+                        return True
+                    if self._acquire_once(session, now):
+                        return True
+                except ConnectionFailure as e:  # server unreachable, counts as a failed attempt
+                    if not blocking:
+                        raise AcquireTimeout("Lock not acquired, mongodb unavailable: {}".format(e))
+                    sleep(self._backoff(step, count, deadline, backoff_base, backoff_cap, jitter))
+                    continue
+                if blocking:  # only the holder's expiry is needed, and only once it has passed
+                    if holder_expire is None or holder_expire <= now:
+                        try:
+                            holder_expire = self._holder_expire(session)
+                        except ConnectionFailure:  # no holder info this round, plain backoff
+                            holder_expire = None
+                    delay = self._backoff(step, count, deadline, backoff_base, backoff_cap, jitter)
+                    if holder_expire is not None:  # wake right after the lock runs out rather than up to a delay later
+                        until_expire = (holder_expire - now).total_seconds()
+                        delay = min(delay, max(until_expire, 0) + random() * jitter)
+                    # wake on release instead of polling, unless the wait is too short to read a stream in
+                    if stream is None and self._watch_supported and 0 < watch_await <= delay:
+                        try:
+                            stream = self.watch_release(max_await_time_ms=max(int(watch_await * 1000), 1))
+                            self._watch_supported = stream is not None
+                        except PyMongoError:  # transient, back off with a plain sleep this round
+                            pass
+                    stream = self._wait_release(stream, delay)
                 else:
-                    res = self.collection.insert_one(payload)
-                return res
-            except DuplicateKeyError:
-                existing = self.collection.find_one({'_id': self.key})
-                countdown = (datetime.utcnow() - existing['ts_expire']).total_seconds()
-                if not blocking:
+                    try:
+                        existing = self.collection.find_one({'_id': self.key},
+                                                            projection={'host': 1, 'pid': 1, 'ts_expire': 1},
+                                                            session=session)
+                    except ConnectionFailure as e:
+                        raise AcquireTimeout("Lock not acquired, mongodb unavailable: {}".format(e))
+                    if existing is None:  # released since the attempt, the holder is gone
+                        raise LockExists('{} already locked'.format(self.key))
+                    countdown = (existing['ts_expire'] - now).total_seconds()
                     raise LockExists('{} owned by {} pid {}, expires in {}s'.format(self.key,
                                                                                     existing['host'],
                                                                                     existing.get('pid', '?'),
                                                                                     countdown))
-                else:
-                    sleep(step)
+        finally:
+            if stream is not None:
+                stream.close()
         raise AcquireTimeout("Timeout reached, lock not acquired")
 
+    def _wait_release(self, stream, delay):
+        """
+        Waits delay seconds, returning early when the change stream reports the lock's
+        release. The stream is read for the whole wait, so it can run over by up to the
+        stream's max_await_time_ms. Sleeps instead without a stream, or once the stream fails.
+
+        :return: the stream, or None if it failed and was closed
+        """
+        end = monotonic() + delay
+        if stream is not None:
+            try:
+                while monotonic() < end:
+                    if stream.try_next() is not None:
+                        return stream
+                return stream
+            except PyMongoError:
+                stream.close()
+                stream = None
+        sleep(max(end - monotonic(), 0))
+        return stream
+
+    def _holder_expire(self, session=None):
+        """Expiry of the current lock holder, None if the lock is free"""
+        existing = self.collection.find_one({'_id': self.key}, projection={'ts_expire': 1}, session=session)
+        return existing['ts_expire'] if existing else None
+
+    def _payload(self, created):
+        """Lock document for an acquire at time created, expiring at self.ts_expire"""
+        if self._payload_base is None:
+            self._payload_base = {'_id': self.key,
+                                  'host': self.host,
+                                  'uuid': self._uuid,
+                                  'pid': self.pid}
+        payload = dict(self._payload_base)
+        payload.update(ts_created=created, ts_expire=self.ts_expire)
+        return payload
+
+    @classmethod
+    def acquire_many(cls, keys, db, blocking=True, timeout=None, step=0.25, **kwargs):
+        """
+        Acquires several locks as a unit: either all of them are acquired or none are.
+        Each attempt upserts every lock with a single bulk write, taking over expired locks
+        just like acquire(), so N locks cost one round-trip per attempt rather than N.
+        If any of them is held by someone else, the ones this attempt got are released again
+        before backing off, so a waiting call never sits on part of the set.
+
+        :param keys: Names of the distributed locks
+        :type keys: list
+        :param db: Connection to a MongoDB database
+        :param blocking: If true (default), will retry the locks held by others until acquired.
+        :type blocking: bool
+        :param timeout: blocking acquire will fail after timeout in seconds if the locks haven't been acquired yet.
+        :type timeout: int
+        :param step: delay before the second attempt, later delays back off exponentially
+        :type step: float or int
+        :param kwargs: passed on to MongoLocker() for each key
+        :return: one owned MongoLocker per key, all sharing a uuid
+        :rtype: list
+        """
+        locks = [cls(key, db, **kwargs) for key in keys]
+        if not locks:
+            return locks
+        first = locks[0]
+        for lock in locks[1:]:
+            lock._uuid = first._uuid
+            lock.uuid = first.uuid
+        if first.timeparanoid is True:
+            first._verifytime()
+        held = []
+        count = 0
+        deadline = cls._deadline(blocking, timeout)
+        try:
+            while cls._acquireretry(blocking, deadline, count):
+                count += 1
+                started = monotonic()
+                created = _utcnow()
+                requests = []
+                for lock in locks:
+                    lock.ts_expire = created + lock._ttl_delta
+                    fields = lock._payload(created)
+                    del fields['_id']
+                    requests.append(UpdateOne(lock._takeover_filter(created), {'$set': fields}, upsert=True))
+                held = []
+                try:
+                    first.collection.bulk_write(requests, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details['writeErrors']
+                    if any(error['code'] != 11000 for error in errors):
+                        raise
+                    held = [locks[error['index']].key for error in errors]
+                if not held:
+                    for lock in locks:
+                        lock._local_expire = started + lock._ttl
+                        lock._ts_created = created
+                        lock._start_renewer()
+                    return locks
+                cls.release_many(locks)  # all or nothing, don't hold some while waiting on the rest
+                if blocking:
+                    sleep(first._backoff(step, count, deadline))
+        except Exception:
+            cls.release_many(locks)
+            raise
+        if not blocking:
+            raise LockExists('{} already locked'.format(', '.join(held)))
+        raise AcquireTimeout("Timeout reached, locks not acquired")
+
+    @classmethod
+    def release_many(cls, locks):
+        """
+        Releases every lock owned by these instances in a single delete_many round-trip.
+        All locks must share a collection.
+
+        :return: number of locks removed
+        :rtype: int
+        """
+        if not locks:
+            return 0
+        for lock in locks:
+            lock._local_expire = None
+            lock._stop_renewer()
+        res = locks[0].collection.delete_many({'$or': [{'_id': lock.key, 'uuid': lock._uuid}
+                                                       for lock in locks]})
+        return res.deleted_count
+
+    def acquire_if_free(self, session=None):
+        """
+        Makes a single, non-blocking attempt to take the lock. Succeeds if no
+        lock exists, the existing lock has expired, or this instance already holds it. Checking and taking the
+        lock happen in one atomic round-trip, so there is no window between
+        'is it free' and 'take it' for another instance to slip through.
+
+        :param session: optional pymongo ClientSession to run the operation in
+        :type session: pymongo.client_session.ClientSession
+        :return: True if this instance now owns the lock
+        :rtype: bool
+        """
+        if self.timeparanoid is True:
+            self._verifytime()
+        self._finish_release()
+        return self._acquire_once(session)
+
+    def _acquire_once(self, session=None, now=None):
+        """
+        One atomic compare-and-swap acquire attempt: upserts the lock document if it's
+        missing, expired, or already ours. A lock held by someone else makes the upsert
+        collide on _id.
+
+        :return: True if this instance now owns the lock
+        :rtype: bool
+        """
+        started = monotonic()
+        created = now or _utcnow()
+        ts_expire = created + self._ttl_delta
+        fields = self._payload(created)
+        fields['ts_expire'] = ts_expire
+        del fields['_id']
+        try:
+            res = self.collection.find_one_and_update(self._takeover_filter(created),
+                                                      {'$set': fields},
+                                                      upsert=True,
+                                                      return_document=ReturnDocument.AFTER,
+                                                      session=session)
+        except DuplicateKeyError:  # held by someone else and not expired
+            return False
+        if res and res.get('uuid') == self._uuid:
+            self.ts_expire = ts_expire
+            self._local_expire = started + self._ttl
+            self._ts_created = created
+            self._start_renewer()
+            return True
+        return False
+
+    def _takeover_filter(self, now):
+        """Matches this lock's document if it has expired or is already ours, an upsert on it collides otherwise"""
+        return {'_id': self.key,
+                '$or': [{'ts_expire': {'$lte': now}},
+                        {'uuid': self._uuid}]}
+
+    def _start_renewer(self):
+        """Starts the background renewal thread if renew_interval is set and it isn't running yet"""
+        if not self.renew_interval:
+            return
+        # a thread told to stop by release() may still be alive, mid touch(), and exits without renewing
+        # this acquire, so it's replaced rather than reused
+        if self._renewer is not None and self._renewer.is_alive() and not self._renew_stop.is_set():
+            return
+        self._renew_stop = threading.Event()
+        self._renewer = threading.Thread(target=self._renew_loop, args=(self._renew_stop,),
+                                         name='MongoLocker-renew-{}'.format(self.key))
+        self._renewer.daemon = True
+        self._renewer.start()
+
+    def _renew_loop(self, stop):
+        """Touches the lock every renew_interval seconds, exits once released or lost"""
+        while not stop.wait(self.renew_interval):
+            try:
+                if not self.touch():
+                    return
+            except PyMongoError:  # transient, the lock stays valid until ts_expire, retry next interval
+                pass
+
+    def _stop_renewer(self):
+        if self._renew_stop is not None:
+            self._renew_stop.set()
+
+    @classmethod
+    def touch_many(cls, locks):
+        """
+        Renews every lock owned by these instances in a single bulk write, then reads all
+        of them back in a single query, so K locks cost two round-trips rather than K.
+        Locks that are no longer owned are left alone. All locks must share a collection.
+
+        :param locks: MongoLocker instances
+        :type locks: list
+        :return: current (valid) lock documents keyed on lock key, whoever owns them
+        :rtype: dict
+        """
+        if not locks:
+            return {}
+        collection = locks[0]._touch_col
+        started = monotonic()
+        now = _utcnow()
+        collection.bulk_write([UpdateOne({'_id': lock.key,
+                                          'uuid': lock._uuid,
+                                          'ts_expire': {'$gt': now}},
+                                         {'$set': {'ts_expire': now + lock._ttl_delta}})
+                               for lock in locks], ordered=False)
+        current = {doc['_id']: doc for doc in collection.find({'_id': {'$in': [lock.key for lock in locks]},
+                                                               'ts_expire': {'$gt': now}})}
+        for lock in locks:
+            doc = current.get(lock.key)
+            if doc and doc['uuid'] == lock._uuid:
+                lock.ts_expire = doc['ts_expire']
+                lock._local_expire = started + lock._ttl
+            else:
+                lock._local_expire = None
+        return current
+
     def locked(self):
         """
         Returns current status of the lock, but does not indicate if
@@ -194,11 +620,7 @@ class MongoLocker(object):
         :return: Lock status
         :rtype: bool
         """
-        locked = False
-        res = self.collection.find_one({'_id': self.key, 'ts_expire': {'$gt': datetime.utcnow()}})
-        if res:
-            locked = res['locked']
-        return locked
+        return bool(self.collection.find_one(self._live_filter(), projection={'_id': 1}))
 
     def owned(self):
         """
@@ -209,51 +631,135 @@ class MongoLocker(object):
         :return: Owner status
         :rtype: bool
         """
-        return bool(self.collection.find_one({'_id': self.key,
-                                       'uuid': self.uuid,
-                                       'locked': True,
-                                       'ts_expire': {'$gt': datetime.utcnow()}}))
+        return bool(self.collection.find_one(self._live_filter(owned=True), projection={'_id': 1}))
 
     def get_current(self):
         """
         Returns the current (valid) lock object from the database,
         regardless of which instance it is owned by.
         """
-        return self.collection.find_one({'_id': self.key,
-                                  'locked': True,
-                                  'ts_expire': {'$gt': datetime.utcnow()}})
+        return self.collection.find_one(self._live_filter())
+
+    def _live_filter(self, owned=False, now=None):
+        """Query for this key's unexpired lock document, owned=True narrows it to this instance"""
+        if self._filter_base is None:
+            self._filter_base = {'_id': self.key}
+            self._owned_filter_base = dict(self._filter_base, uuid=self._uuid)
+        query = dict(self._owned_filter_base if owned else self._filter_base)
+        query['ts_expire'] = {'$gt': now or _utcnow()}
+        return query
+
+    @classmethod
+    def statuses(cls, db, keys, dbcollection='mongolocker'):
+        """
+        Returns the current (valid) lock objects for several keys with a single
+        query, regardless of which instance they are owned by.
 
-    def release(self, force=False):
+        :param db: Connection to a MongoDB database
+        :param keys: Names of the distributed locks
+        :type keys: list
+        :param dbcollection: name of the lock collection
+        :type dbcollection: str
+        :return: lock document, or None if not locked, keyed by lock name
+        :rtype: dict
+        """
+        keys = list(keys)
+        current = dict.fromkeys(keys)
+        for doc in _lock_collection(db, dbcollection).find({'_id': {'$in': keys},
+                                                            'ts_expire': {'$gt': _utcnow()}}):
+            current[doc['_id']] = doc
+        return current
+
+    def watch_release(self, max_await_time_ms=None):
+        """
+        Opens a change stream that reports deletion of this lock's document,
+        i.e. when the lock is released or removed by the TTL monitor.
+        Change streams require a replica set or sharded cluster.
+
+        :param max_await_time_ms: longest time the server waits for an event before try_next() returns
+        :type max_await_time_ms: int
+        :return: change stream, or None if the server doesn't support change streams
+        :rtype: pymongo.change_stream.ChangeStream
+        """
+        pipeline = [{'$match': {'operationType': 'delete',
+                                'documentKey._id': self.key}}]
+        try:
+            return self.collection.watch(pipeline, max_await_time_ms=max_await_time_ms)
+        except OperationFailure:  # standalone server
+            return None
+
+    def release(self, force=False, session=None, wait=True):
         """
         releases lock if owned by the current instance.
 
         :param force: CAUTION: Forces the release to happen,
         even if the local instance isn't the lock owner.
         :type force: bool
+        :param session: optional pymongo ClientSession to run the operation in
+        :type session: pymongo.client_session.ClientSession
+        :param wait: If false, return right away and delete the lock from a background thread.
+         A failed background release is ignored, the lock then runs out at ts_expire.
+         The next acquire by this instance waits for it to finish.
+        :type wait: bool
+        :return: True if a lock was removed, None if not waited for
+        :rtype: bool
         """
-        if force:
-            query = {'_id': self.key}
-        else:
-            query = {'_id': self.key,
-                     'uuid': self.uuid}
-        self.collection.delete_many(query)
+        self._local_expire = None
+        self._stop_renewer()
+        query = {'_id': self.key} if force else {'_id': self.key, 'uuid': self._uuid}
+        if not wait:
+            if session is not None:
+                raise ValueError("A session can't be shared with a background release")
+            self._finish_release()
+            self._releaser = threading.Thread(target=self._release_quietly, args=(query,),
+                                              name='MongoLocker-release-{}'.format(self.key))
+            self._releaser.daemon = True
+            self._releaser.start()
+            return None
+        self._finish_release()
+        res = self.collection.delete_one(query, session=session)
+        return res.deleted_count > 0
+
+    def _release_quietly(self, query):
+        try:
+            self.collection.delete_one(query)
+        except PyMongoError:  # the lock expires on its own
+            pass
+
+    def _finish_release(self):
+        """Waits for a pending background release, so it can't remove a newer acquire of this instance"""
+        if self._releaser is not None:
+            self._releaser.join()
+            self._releaser = None
 
-    def touch(self):
+    def touch(self, min_remaining=None, session=None):
         """
         Renews lock expiration timestamp
 
+        :param min_remaining: If set, skip the renewal (and its round-trip) while more than
+         min_remaining seconds are left on the lock as last acquired or renewed by this instance.
+         A skipped renewal doesn't re-check the database, so it won't notice a forced takeover.
+        :type min_remaining: int or float
+        :param session: optional pymongo ClientSession to run the operation in
+        :type session: pymongo.client_session.ClientSession
         :return: new expiration timestamp
         :rtype: datetime
         """
-        ts_expire = datetime.utcnow() + timedelta(seconds=int(self._ttl))
-        result = self.collection.find_one_and_update({'_id': self.key,
-                                               'uuid': self.uuid,
-                                               'locked': True,
-                                               'ts_expire': {'$gt': datetime.utcnow()}},
-                                              {'$set': {'ts_expire': ts_expire}},
-                                              return_document=ReturnDocument.AFTER)
+        started = monotonic()
+        if min_remaining is not None and self._local_expire is not None:
+            if self._local_expire - started > min_remaining:
+                return self.ts_expire
+        now = _utcnow()
+        ts_expire = now + self._ttl_delta
+        result = self._touch_col.find_one_and_update(self._live_filter(owned=True, now=now),
+                                                     {'$set': {'ts_expire': ts_expire}},
+                                                     projection={'_id': 0, 'ts_expire': 1},
+                                                     return_document=ReturnDocument.AFTER,
+                                                     session=session)
         if result:
             self.ts_expire = result['ts_expire']
+            self._local_expire = started + self._ttl
             return self.ts_expire
         else:
+            self._local_expire = None
             return False
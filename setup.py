@@ -15,11 +15,11 @@ with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
 requirements = [
-    'pymongo'
+    'pymongo>=3.8'
 ]
 
 test_requirements = [
-    'pymongo'
+    'pymongo>=3.8'
 ]
 
 setup(
@@ -1 +1,29 @@
 # -*- coding: utf-8 -*-
+import os
+import unittest
+
+from pymongo import MongoClient
+
+# each pytest-xdist worker gets its own database, so workers never clean up each other's locks
+DBNAME = 'ml_unittest_' + os.environ['PYTEST_XDIST_WORKER'] if 'PYTEST_XDIST_WORKER' in os.environ else 'ml_unittest'
+
+
+class MongoTestCase(unittest.TestCase):
+    """
+    Shares one client per test class, so server discovery happens once, and drops
+    the collections the class uses before and after it runs
+    """
+    collections = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient()
+        cls.db = cls.client[DBNAME]
+        for name in cls.collections:  # once, the first locker or elector rebuilds the indexes
+            cls.db.drop_collection(name)
+
+    @classmethod
+    def tearDownClass(cls):
+        for name in cls.collections:
+            cls.db.drop_collection(name)
+        cls.client.close()
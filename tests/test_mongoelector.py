@@ -10,34 +10,30 @@ Tests for `mongoelector` module.
 
 import unittest
 from time import sleep
-from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.errors import ServerSelectionTimeoutError
 from mongoelector import MongoElector
 from random import randint
+from tests import MongoTestCase
+try:
+    from unittest import mock
+except ImportError:  # python 2
+    import mock
 
 
-class TestMongoelector(unittest.TestCase):
+class TestMongoelector(MongoTestCase):
     """Test Mongoelector Functionality"""
-
-    def setUp(self):
-        """setup unittests"""
-        db = getattr(MongoClient(), "ml_unittest")
-        db.ml_unittest.electorlocks.drop()
-
-
-    def tearDown(self):
-        """teardown unittests"""
-        db = getattr(MongoClient(), "ml_unittest")
-        db.electorlocks.drop()
+    collections = ('elector.locks', 'elector.status')  # keys are random per test, no per-test cleanup
 
 
     def test_000_init(self):
         """Smoke test"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
 
         MongoElector('test_001_init', db)
 
     def test_001_run(self):
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
 
         m1 = MongoElector('test_001_run_' + str(randint(0,10000)), db,
                           ttl=15)
@@ -58,7 +54,83 @@ class TestMongoelector(unittest.TestCase):
             sleep(1)
         self.assertFalse(m1.ismaster)
 
+    def test_002_poll_many(self):
+        db = self.db
+        prefix = 'test_002_poll_many_' + str(randint(0, 10000))
+        electors = [MongoElector('{}_{}'.format(prefix, i), db, ttl=15) for i in range(3)]
+        MongoElector.poll_many(electors)
+        self.assertTrue(all(e.ismaster for e in electors))
+        self.assertTrue(all(e.cluster_detail['master'] for e in electors))
+        MongoElector.poll_many(electors)  # renewal round
+        self.assertTrue(all(e.ismaster for e in electors))
+        for e in electors:
+            e.stop()
+        self.assertFalse(any(e.ismaster for e in electors))
+
+    def test_003_master_detail(self):
+        key = 'test_003_master_detail_' + str(randint(0, 10000))
+        m1 = MongoElector(key, self.db, ttl=15)
+        m2 = MongoElector(key, self.db, ttl=15)
+        self.assertIsNone(m1.master_detail)
+        m1.poll()
+        m2.poll()
+        self.assertTrue(m1.ismaster)
+        for detail in (m1.master_detail, m2.master_detail):
+            self.assertEqual(detail, {'host': m1.mlock.host,
+                                      'process_id': m1.mlock.pid,
+                                      'uuid': m1.mlock.uuid})
+        m1.stop()
+        m2.stop()
 
+    def test_004_start_many(self):
+        prefix = 'test_004_start_many_' + str(randint(0, 10000))
+        electors = [MongoElector('{}_{}'.format(prefix, i), self.db, ttl=2) for i in range(3)]
+        thread = MongoElector.start_many(electors)
+        c = 0
+        while c < 50 and not all(e.ismaster for e in electors):
+            c += 1
+            sleep(0.1)
+        self.assertTrue(all(e.ismaster for e in electors))
+        electors[0].stop()
+        self.assertFalse(electors[0].ismaster)
+        self.assertFalse(electors[0].running)
+        sleep(1.5)  # the remaining electors keep being polled, and renewed, by the shared thread
+        self.assertTrue(thread.is_alive())
+        self.assertTrue(all(e.ismaster and e.running for e in electors[1:]))
+        self.assertFalse(electors[0].ismaster)
+        electors[1].stop()
+        self.assertTrue(thread.is_alive())
+        electors[2].stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(any(e.ismaster for e in electors))
+
+
+class TestMongoelectorLogic(unittest.TestCase):
+    """Elector thread behaviour that needs no server, run against a mocked database"""
+
+    def test_001_watch_error(self):
+        """the elector thread survives a change stream that can't be opened"""
+        elector = MongoElector('test_watch_error', mock.MagicMock(spec=Database), ttl=1)
+        elector.mlock = mock.MagicMock()
+        elector.mlock.watch_release.side_effect = ServerSelectionTimeoutError('server down')
+        elector.poll = mock.Mock()
+        elector.start()
+        c = 0
+        while c < 50 and elector.mlock.watch_release.call_count < 2:
+            c += 1
+            sleep(0.1)
+        self.assertTrue(elector.mlock.watch_release.call_count >= 2)  # retried on the next wait
+        self.assertTrue(elector.elector_thread.is_alive())
+        elector.stop()
+        self.assertFalse(elector.elector_thread.is_alive())
+
+    def test_002_start_many_shared_db(self):
+        """electors on different databases are refused before any thread starts"""
+        electors = [MongoElector('test_shared_db', mock.MagicMock(spec=Database)) for _ in range(2)]
+        with self.assertRaises(ValueError):
+            MongoElector.start_many(electors)
+        self.assertIsNone(electors[0].elector_thread)
 
 
 if __name__ == '__main__':
@@ -8,46 +8,35 @@ test_mongoelector
 Tests for `mongoelector` module.
 """
 
-import os
 import sys
+import threading
 import unittest
 import time
 from datetime import datetime, timedelta
-sys.path.insert(0, os.path.abspath('..'))
-# noinspection PyPep8
-from mongoelector import MongoLocker, LockExists
-# noinspection PyPep8
-from pymongo import MongoClient
+from mongoelector import MongoLocker, LockExists, AcquireTimeout
+from mongoelector.locker import monotonic
+from pymongo.database import Database
+from pymongo.errors import AutoReconnect
+from tests import MongoTestCase
+try:
+    from unittest import mock
+except ImportError:  # python 2
+    import mock
 
 
-class TestMongoLocker(unittest.TestCase):
+class TestMongoLocker(MongoTestCase):
     """Test MongoLocker Functionality"""
+    collections = ('mongolocker',)
 
     def setUp(self):
         """Setup Unittests"""
-        MongoClient().ml_unittest.mongolocker.drop()
-
-    def tearDown(self):
-        """Teardown unittests"""
-        MongoClient().ml_unittest.mongolocker.drop()
-
-    def test_001_init(self):
-        """Smoke test"""
-        db = getattr(MongoClient(), "ml_unittest")
-        MongoLocker('testinit', db)
-        with self.assertRaises(TypeError):
-            MongoLocker(None, None)
-        with self.assertRaises(ValueError):
-            MongoLocker('testinit', db, ttl='not-an-int')
-
-
+        # delete rather than drop, the indexes MongoLocker sets up once per client have to survive
+        self.db.mongolocker.delete_many({})
 
     def test_002_cycle(self):
         """run some lock cycles"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
         ml = MongoLocker('testcycle', db)
-        if ml.locked():  # cleanup any leftovers
-            ml.release(force=False)
         ml.acquire()
         self.assertTrue(ml.locked())
         self.assertTrue(ml.owned())
@@ -60,42 +49,28 @@ class TestMongoLocker(unittest.TestCase):
 
     def test_003_paranoid(self):
         """test time paranoia"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
         ml = MongoLocker('testinit', db, timeparanoid=True)
         ml._verifytime()
 
     def test_004_force_release(self):
         """Force releases"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
         ml1 = MongoLocker('testrelease', db)
         ml2 = MongoLocker('testrelease', db)
         ml1.acquire()
         with self.assertRaises(LockExists):
             ml2.acquire(blocking=False)
-        ml2.release()
+        self.assertFalse(ml2.release())
         self.assertTrue(ml1.locked())
         self.assertTrue(ml1.owned())
-        ml2.release(force=True)
+        self.assertTrue(ml2.release(force=True))
         self.assertFalse(ml1.locked())
         self.assertFalse(ml1.owned())
 
-    def test_005_acquire_retry(self):
-        """Test method that determines if an acquire retry is appropriate"""
-        _acquireretry = MongoLocker._acquireretry
-        start = datetime.utcnow()
-        self.assertTrue(_acquireretry(True, start, 0, 0))  # initial entry
-        with self.assertRaises(ValueError):
-            _acquireretry(False, start, 30, 0)  # blocking false w/ timeout
-        start = datetime.utcnow()
-        self.assertTrue(_acquireretry(True, start, 10, 1))  # blocking true, count > 0
-        self.assertTrue(_acquireretry(True, start, 10, 0))  # blocking true, count 0
-        past = datetime.utcnow() - timedelta(minutes=1)
-        self.assertFalse(_acquireretry(True, past, 50, 10))  # passed timeout
-        self.assertFalse(_acquireretry(False, start, None, 1))  # non-blocking
-
     def test_006_acquire_force(self):
         """Test stealing the lock"""
-        db = getattr(MongoClient(), "testcycle")
+        db = self.client.testcycle
         a = MongoLocker('testcycle', db)
         b = MongoLocker('testcycle', db)
         a.acquire()
@@ -110,18 +85,18 @@ class TestMongoLocker(unittest.TestCase):
 
     def test_007_touch(self):
         """ensure touch updates the expiration timestamp"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
         ml = MongoLocker('testtouch', db)
         ml.acquire()
         start = ml.ts_expire
-        time.sleep(1)
+        time.sleep(0.01)  # stored timestamps have millisecond resolution
         self.assertTrue(ml.touch())
         end = ml.ts_expire
         self.assertTrue(end > start)
 
     def test_008_status(self):
         """Test lock status property"""
-        db = getattr(MongoClient(), "ml_unittest")
+        db = self.db
         ml = MongoLocker('teststatus', db)
         a = ml.status
         self.assertIsInstance(a['pid'], int)
@@ -136,5 +111,246 @@ class TestMongoLocker(unittest.TestCase):
         self.assertIsInstance(b['lock_expires'], datetime)
         self.assertIsInstance(b['lock_created'], datetime)
 
+    def test_009_acquire_if_free(self):
+        """Single attempt acquire only succeeds when the lock is free or expired"""
+        db = self.db
+        a = MongoLocker('testiffree', db)
+        b = MongoLocker('testiffree', db)
+        self.assertTrue(a.acquire_if_free())
+        self.assertFalse(b.acquire_if_free())
+        self.assertTrue(a.owned())
+        db.mongolocker.update_one({'_id': 'testiffree'},
+                                  {'$set': {'ts_expire': datetime.utcnow() - timedelta(seconds=1)}})
+        self.assertTrue(b.acquire_if_free())
+        self.assertTrue(b.owned())
+        self.assertFalse(a.owned())
+        b.release()
+
+    def test_010_touch_min_remaining(self):
+        """touch skips the renewal while enough of the ttl remains"""
+        db = self.db
+        ml = MongoLocker('testtouchskip', db, ttl=60)
+        self.assertFalse(ml.touch(min_remaining=30))  # not owned, nothing to skip
+        ml.acquire()
+        start = ml.ts_expire
+        self.assertEqual(ml.touch(min_remaining=30), start)
+        self.assertTrue(ml.touch(min_remaining=60) >= start)
+        ml.release()
+
+    def test_012_acquire_many(self):
+        """acquire several locks at once, all or nothing"""
+        db = self.db
+        locks = MongoLocker.acquire_many(['testmany1', 'testmany2'], db)
+        self.assertTrue(all(ml.owned() for ml in locks))
+        with self.assertRaises(LockExists):
+            MongoLocker.acquire_many(['testmany2', 'testmany3'], db, blocking=False)
+        self.assertFalse(MongoLocker('testmany3', db).locked())  # partial acquire rolled back
+        self.assertEqual(MongoLocker.release_many(locks), 2)
+        self.assertFalse(any(ml.locked() for ml in locks))
+
+    def test_013_renew_interval(self):
+        """background renewal keeps a short ttl lock alive until released"""
+        db = self.db
+        ml = MongoLocker('testrenew', db, ttl=1, renew_interval=0.2)
+        ml.acquire()
+        time.sleep(1.5)
+        self.assertTrue(ml.owned())
+        ml.release()
+        ml._renewer.join(1)
+        self.assertFalse(ml._renewer.is_alive())
+        self.assertFalse(ml.locked())
+
+    def test_014_statuses(self):
+        """look up several locks with one query"""
+        db = self.db
+        ml = MongoLocker('teststatuses1', db)
+        ml.acquire()
+        current = MongoLocker.statuses(db, ['teststatuses1', 'teststatuses2'])
+        self.assertEqual(str(current['teststatuses1']['uuid']), ml.uuid)
+        self.assertIsNone(current['teststatuses2'])
+        ml.release()
+
+    def test_015_touch_many(self):
+        """renew several locks with one bulk write"""
+        db = self.db
+        mine = MongoLocker('testtouchmany1', db)
+        theirs = MongoLocker('testtouchmany2', db)
+        mine.acquire()
+        theirs.acquire()
+        theirs.release()
+        current = MongoLocker.touch_many([mine, theirs])
+        self.assertEqual(list(current), ['testtouchmany1'])
+        self.assertEqual(mine.ts_expire, current['testtouchmany1']['ts_expire'])
+        self.assertEqual(MongoLocker.touch_many([]), {})
+        mine.release()
+
+    def test_016_cached_status(self):
+        """cached status matches the database while the lock is held"""
+        db = self.db
+        ml = MongoLocker('testcachedstatus', db)
+        self.assertFalse(ml.get_status(cached=True)['lock_owned'])
+        ml.acquire()
+        cached = ml.get_status(cached=True)
+        fresh = ml.get_status()
+        self.assertTrue(cached['lock_owned'])
+        self.assertEqual(cached['lock_created'], fresh['lock_created'])
+        self.assertEqual(cached['lock_expires'], fresh['lock_expires'])
+        ml.release()
+        self.assertFalse(ml.get_status(cached=True)['lock_owned'])
+
+    def test_017_release_nowait(self):
+        """background release frees the lock and a re-acquire waits for it"""
+        db = self.db
+        ml = MongoLocker('testreleasenowait', db)
+        ml.acquire()
+        self.assertIsNone(ml.release(wait=False))
+        self.assertTrue(ml.acquire(blocking=False))
+        self.assertTrue(ml.owned())
+        ml.release(wait=False)
+        ml._finish_release()
+        self.assertFalse(ml.locked())
+        self.assertRaises(ValueError, ml.release, wait=False, session=object())
+
+    def test_018_blocking_backoff(self):
+        """a blocked acquire retries on the backoff schedule, without really sleeping"""
+        db = self.db
+        holder = MongoLocker('testblocking', db)
+        waiter = MongoLocker('testblocking', db, backoff_base=2, backoff_cap=1, backoff_jitter=0)
+        waiter._watch_supported = False  # poll only, even on a replica set
+        holder.acquire()
+        delays = []
+
+        def fake_sleep(seconds):
+            delays.append(seconds)
+            if len(delays) == 3:
+                holder.release()
+
+        with mock.patch('mongoelector.locker.sleep', fake_sleep):
+            self.assertTrue(waiter.acquire(timeout=30))
+        self.assertEqual([round(d, 2) for d in delays], [0.25, 0.5, 1])
+        waiter.release()
+
+    def test_019_renew_after_reacquire(self):
+        """re-acquiring while the old renewer is still mid touch() gets a renewer of its own"""
+        db = self.db
+        ml = MongoLocker('testrenewagain', db, ttl=1, renew_interval=0.2)
+        touching = threading.Event()
+        resume = threading.Event()
+        touch = ml.touch
+
+        def slow_touch(*args, **kwargs):
+            if not touching.is_set():  # hold the first renewal until the lock has been re-acquired
+                touching.set()
+                resume.wait(5)
+            return touch(*args, **kwargs)
+
+        ml.touch = slow_touch
+        ml.acquire()
+        self.assertTrue(touching.wait(5))
+        ml.release()
+        ml.acquire()
+        resume.set()
+        time.sleep(1.5)
+        self.assertTrue(ml.owned())
+        ml.release()
+
+    def test_022_acquire_many_contended(self):
+        """a blocked acquire_many holds none of its locks while waiting, and takes over expired ones"""
+        db = self.db
+        holder = MongoLocker('testmanyheld', db)
+        holder.acquire()
+        stale = MongoLocker('testmanystale', db)
+        stale.acquire()
+        db.mongolocker.update_one({'_id': 'testmanystale'},
+                                  {'$set': {'ts_expire': datetime.utcnow() - timedelta(seconds=1)}})
+        free_while_waiting = []
+
+        def fake_sleep(seconds):
+            free_while_waiting.append(not MongoLocker('testmanyfree', db).locked())
+            holder.release()
+
+        with mock.patch('mongoelector.locker.sleep', fake_sleep):
+            locks = MongoLocker.acquire_many(['testmanyfree', 'testmanyheld', 'testmanystale'], db, timeout=30)
+        self.assertEqual(free_while_waiting, [True])
+        self.assertTrue(all(ml.owned() for ml in locks))
+        self.assertFalse(stale.owned())
+        MongoLocker.release_many(locks)
+
+
+class TestMongoLockerLogic(unittest.TestCase):
+    """MongoLocker logic that needs no server, run against a mocked database"""
+
+    def test_001_init(self):
+        """Smoke test"""
+        db = mock.MagicMock(spec=Database)  # argument checks only, no server needed
+        MongoLocker('testinit', db)
+        with self.assertRaises(TypeError):
+            MongoLocker(None, None)
+        with self.assertRaises(ValueError):
+            MongoLocker('testinit', db, ttl='not-an-int')
+
+    def test_005_acquire_retry(self):
+        """Test method that determines if an acquire retry is appropriate"""
+        _acquireretry = MongoLocker._acquireretry
+        _deadline = MongoLocker._deadline
+        with self.assertRaises(ValueError):
+            _deadline(False, 30)  # blocking false w/ timeout
+        self.assertIsNone(_deadline(True, None))
+        deadline = _deadline(True, 10)
+        self.assertTrue(_acquireretry(True, deadline, 0))  # initial entry
+        self.assertTrue(_acquireretry(True, deadline, 1))  # blocking true, count > 0
+        self.assertTrue(_acquireretry(True, None, 10))  # blocking true, no timeout
+        self.assertFalse(_acquireretry(True, monotonic() - 1, 10))  # passed timeout
+        self.assertTrue(_acquireretry(False, None, 0))  # non-blocking, first attempt
+        self.assertFalse(_acquireretry(False, None, 1))  # non-blocking
+
+    def test_011_backoff(self):
+        """acquire delays grow exponentially, are capped, and never pass the timeout"""
+        db = mock.MagicMock(spec=Database)
+        ml = MongoLocker('testbackoff', db, backoff_base=2, backoff_cap=1, backoff_jitter=0)
+        self.assertEqual(ml._backoff(0.25, 1, None), 0.25)
+        self.assertEqual(ml._backoff(0.25, 2, None), 0.5)
+        self.assertEqual(ml._backoff(0.25, 10, None), 1)
+        self.assertTrue(ml._backoff(0.25, 10, monotonic() + 0.1) <= 0.1)
+        self.assertEqual(ml._backoff(0.25, 10, monotonic() - 30), 0)
+        self.assertEqual(ml._backoff(0.25, 10, None, cap=2), 2)  # per-call override
+
+    def test_020_wait_release(self):
+        """a change stream is read for the whole wait, even one shorter than the server-side await"""
+        ml = MongoLocker('testwaitrelease', mock.MagicMock(spec=Database))
+        stream = mock.MagicMock()
+        stream.try_next.side_effect = [None, None, {'operationType': 'delete'}]
+        started = monotonic()
+        self.assertIs(ml._wait_release(stream, 0.5), stream)
+        self.assertTrue(monotonic() - started < 0.5)
+        self.assertEqual(stream.try_next.call_count, 3)
+        stream.try_next.side_effect = None
+        stream.try_next.return_value = None
+        self.assertIs(ml._wait_release(stream, 0.05), stream)  # nothing released, waited out
+
+    def test_021_index_setup_per_client(self):
+        """indexes are set up once per client and collection, and again for any other client"""
+        first = mock.MagicMock(spec=Database)
+        MongoLocker('testindexes1', first)
+        MongoLocker('testindexes2', first)
+        self.assertEqual(first.get_collection.return_value.create_index.call_count, 2)  # ttl + lookup index
+        second = mock.MagicMock(spec=Database)
+        MongoLocker('testindexes1', second)
+        self.assertEqual(second.get_collection.return_value.create_index.call_count, 2)
+
+    def test_023_holder_read_connection_failure(self):
+        """losing the server while reading the holder backs off a blocking acquire, and fails a non-blocking one"""
+        ml = MongoLocker('testholderread', mock.MagicMock(spec=Database), timeparanoid=False)
+        ml._watch_supported = False
+        ml._acquire_once = mock.Mock(side_effect=[False, True])
+        ml._holder_expire = mock.Mock(side_effect=AutoReconnect('primary stepped down'))
+        with mock.patch('mongoelector.locker.sleep'):
+            self.assertTrue(ml.acquire(timeout=30))
+        ml._acquire_once = mock.Mock(return_value=False)
+        ml.collection.find_one.side_effect = AutoReconnect('primary stepped down')
+        with self.assertRaises(AcquireTimeout):
+            ml.acquire(blocking=False)
+
+
 if __name__ == '__main__':
     sys.exit(unittest.main())